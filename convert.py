@@ -8,6 +8,7 @@ import json
 import logging
 from optparse import Values
 import os
+import revocation
 import subprocess
 import sys
 import tempfile
@@ -75,6 +76,15 @@ def get_sig(clearsign_fh):
     return ''.join(sig)
 
 
+def check_revocation(revocation_index, verified):
+    """Exit non-zero if the signing key is unknown, revoked, or expired.
+    """
+    reason = revocation.check_verified(revocation_index, verified)
+    if reason is not None:
+        log.critical("Signature check failed: {}".format(reason))
+        sys.exit(1)
+
+
 # main {{{1
 def main(name=None):
     if name not in (None, __name__):
@@ -101,6 +111,8 @@ def main(name=None):
     print(verified.valid)
     print(verified.key_id)
     print(verified.status)
+    revocation_index = revocation.get_index(gnupghome)
+    check_revocation(revocation_index, verified)
     body = get_body(sys.argv[1])
     if body.endswith('\n') or body.endswith('\r'):
         body = body[:-1]
@@ -125,6 +137,7 @@ def main(name=None):
     print(verified.valid)
     print(verified.key_id)
     print(verified.status)
+    check_revocation(revocation_index, verified)
 
 
 main(name=__name__)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+"""Build a revocation + key expiry index from a gpg homedir, so signature
+checks can ask "is this key still good?" without another gpg call.
+
+The index is a dict of fingerprint -> (primary, created, expires, revoked),
+covering primary keys and subkeys; ``primary`` is the primary key's
+fingerprint (itself, for primary keys), the rest are unix timestamps, and
+``expires`` and ``revoked`` are None if unset.  ``revoked`` is 0 if gpg says
+the key is revoked but we don't know when (e.g. a designated revoker).
+
+It's built with a single ``gpg --check-sigs --with-colons`` call, saved to
+revocations.json, and updated incrementally as new revocation certificates
+are imported.  ``get_index`` only rebuilds it when revocations.json is
+missing, unreadable, or older than the keyring.
+"""
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+log = logging.getLogger(__name__)
+GPG = 'gpg2'
+INDEX_PATH = "revocations.json"
+# In colon listings, a key revocation is a "rev" record with signature class
+# 0x20 that shows up before the first uid/sub of its pub key; a subkey
+# revocation is class 0x28, right after its sub key.
+REVOCATION_CLASSES = {'pub': "20", 'sub': "28"}
+# --check-sigs marks signatures gpg verified with "!" in the validity field.
+GOOD_SIG = "!"
+REVOKED = "r"
+REVOKED_UNKNOWN_TIME = 0
+
+
+# helper functions {{{1
+def dump_json(obj):
+    return json.dumps(obj, indent=2, sort_keys=True)
+
+
+def _to_timestamp(value):
+    """Colon listings use empty strings for "never"."""
+    if value:
+        return int(value)
+    return None
+
+
+def gpg_args(gpg_home):
+    """Same keyring args as gpg.sh and keys.gpg_default_args, so we read the
+    keyring that everything else verifies against.
+    """
+    return [
+        "--homedir", gpg_home,
+        "--no-default-keyring",
+        "--secret-keyring", os.path.join(gpg_home, "secring.gpg"),
+        "--keyring", os.path.join(gpg_home, "pubring.gpg"),
+    ]
+
+
+# parse {{{1
+def parse_colons(output):
+    """Parse ``gpg --with-colons --check-sigs`` output into an index dict.
+
+    Only revocations gpg checked as good and issued by the primary key
+    itself count; a key gpg itself marks as revoked counts even if we didn't
+    see the revocation sig (e.g. a designated revoker), with
+    ``REVOKED_UNKNOWN_TIME`` as the revocation time.
+    """
+    keys = []
+    primary = None
+    primary_keyid = None
+    current = None
+    for line in output.splitlines():
+        fields = line.split(':')
+        record = fields[0]
+        if record in ('pub', 'sub'):
+            if record == 'pub':
+                primary = None
+                primary_keyid = fields[4]
+            current = {
+                "record": record,
+                "primary": primary,
+                "validity": fields[1],
+                "created": _to_timestamp(fields[5]),
+                "expires": _to_timestamp(fields[6]),
+                "revoked": None,
+                "fingerprint": None,
+            }
+            keys.append(current)
+        elif current is None:
+            continue
+        elif record == 'fpr' and current['fingerprint'] is None:
+            current['fingerprint'] = fields[9]
+            if current['record'] == 'pub':
+                primary = current['primary'] = fields[9]
+        elif record in ('uid', 'uat'):
+            current = None
+        elif record == 'rev' and fields[1] == GOOD_SIG and \
+                fields[4] == primary_keyid and \
+                fields[10].startswith(REVOCATION_CLASSES[current['record']]):
+            timestamp = _to_timestamp(fields[5])
+            if current['revoked'] is None or timestamp < current['revoked']:
+                current['revoked'] = timestamp
+    index = {}
+    for key in keys:
+        if key['fingerprint'] is None or key['primary'] is None:
+            continue
+        revoked = key['revoked']
+        if revoked is None and key['validity'] == REVOKED:
+            revoked = REVOKED_UNKNOWN_TIME
+        index[key['fingerprint']] = (
+            key['primary'], key['created'], key['expires'], revoked
+        )
+    return index
+
+
+def list_keys(gpg_home, fingerprints=()):
+    """Single gpg call; returns the colon listing for ``fingerprints``, or
+    for the whole keyring if none are given.
+    """
+    cmd = [GPG] + gpg_args(gpg_home) + [
+        "--with-colons", "--fixed-list-mode", "--check-sigs"
+    ] + list(fingerprints)
+    log.debug("Listing keys: {}".format(cmd))
+    return subprocess.check_output(cmd).decode('utf-8')
+
+
+# build / update {{{1
+def build_index(gpg_home):
+    """Build the index for every public key in ``gpg_home``.
+    """
+    index = parse_colons(list_keys(gpg_home))
+    log.info("Indexed {} keys".format(len(index)))
+    return index
+
+
+def get_index(gpg_home, path=INDEX_PATH):
+    """Load the index from ``path``, or rebuild and save it if it's missing,
+    unreadable, or older than the keyring.
+    """
+    pubring = os.path.join(gpg_home, "pubring.gpg")
+    try:
+        if os.path.getmtime(path) >= os.path.getmtime(pubring):
+            return load_index(path)
+        log.info("{} is older than {}".format(path, pubring))
+    except (OSError, ValueError, TypeError, AttributeError) as exc:
+        log.info("Can't load {}: {}".format(path, exc))
+    index = build_index(gpg_home)
+    save_index(index, path)
+    return index
+
+
+def _rebuild(gpg_home, index):
+    index.clear()
+    index.update(build_index(gpg_home))
+
+
+def _unprotect(revocation_cert):
+    """gpg prefixes the armor header in openpgp-revocs.d/*.rev with a colon,
+    so it can't be imported by accident.  Strip it.
+    """
+    return revocation_cert.replace(
+        ":-----BEGIN PGP PUBLIC KEY BLOCK-----",
+        "-----BEGIN PGP PUBLIC KEY BLOCK-----"
+    )
+
+
+def get_issuer_keyids(gpg_home, revocation_cert):
+    """Return the issuer keyids of the signatures in ``revocation_cert``.
+    """
+    cmd = [GPG] + gpg_args(gpg_home) + ["--batch", "--list-packets"]
+    proc = subprocess.run(cmd, input=revocation_cert.encode('utf-8'),
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    keyids = []
+    for line in proc.stdout.decode('utf-8').splitlines():
+        if line.startswith(":signature packet:") and "keyid " in line:
+            keyids.append(line.split("keyid ")[1].split()[0].upper())
+    return keyids
+
+
+def import_revocation(gpg_home, index, revocation_cert):
+    """Import an ascii-armored revocation certificate and update ``index``
+    in place, re-listing only the revoked keys if we already know them.
+
+    gpg doesn't emit IMPORT_OK for revocation certs, and IMPORT_RES looks
+    the same for a re-import as for a cert it couldn't apply, so success is
+    a zero exit code with something processed.
+    """
+    revocation_cert = _unprotect(revocation_cert)
+    cmd = [GPG] + gpg_args(gpg_home) + ["--batch", "--status-fd", "1", "--import"]
+    proc = subprocess.run(cmd, input=revocation_cert.encode('utf-8'),
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = proc.stdout.decode('utf-8')
+    counts = None
+    for line in output.splitlines():
+        if line.startswith("[GNUPG:] IMPORT_RES "):
+            counts = [int(c) for c in line.split()[2:]]
+    # IMPORT_RES: count no_user_id imported imported_rsa unchanged n_uids
+    #             n_subk n_sigs n_revoc ...
+    if proc.returncode or counts is None or not counts[0]:
+        raise Exception("Failed importing revocation cert!\n{}".format(output))
+    log.debug("Imported {} new revocations".format(counts[8]))
+    keyids = get_issuer_keyids(gpg_home, revocation_cert)
+    primaries = sorted(set(
+        info[0] for fingerprint, info in index.items()
+        if any(fingerprint.endswith(keyid) for keyid in keyids)
+    ))
+    if not primaries:
+        log.info("Unknown issuer {}; rebuilding index".format(', '.join(keyids)))
+        _rebuild(gpg_home, index)
+    else:
+        try:
+            relisted = parse_colons(list_keys(gpg_home, primaries))
+        except subprocess.CalledProcessError:
+            # gpg exits non-zero if none of ``primaries`` are in the keyring
+            log.info("{} not in keyring; rebuilding index".format(', '.join(primaries)))
+            _rebuild(gpg_home, index)
+        else:
+            # ... but silently skips the missing ones if some are.
+            for fingerprint, info in list(index.items()):
+                if info[0] in primaries and fingerprint not in relisted:
+                    del index[fingerprint]
+            index.update(relisted)
+    log.info("Updated {}".format(', '.join(primaries or keyids)))
+    return primaries
+
+
+# lookup {{{1
+def check_key(index, fingerprint, now=None):
+    """Return None if ``fingerprint`` (and its primary key, for a subkey) is
+    unrevoked and unexpired at ``now``, or a string describing why not.
+
+    ``now`` should be the current time or some other trusted time, like the
+    task's creation time; never the signature's own timestamp, which the
+    signer controls.  Revoked keys are bad no matter when they were revoked,
+    since the revocation time isn't the compromise time.
+    """
+    if now is None:
+        now = time.time()
+    info = index.get(fingerprint)
+    if info is None:
+        return "unknown key {}".format(fingerprint)
+    primary, created, expires, revoked = info
+    if revoked == REVOKED_UNKNOWN_TIME:
+        return "key {} revoked (per gpg)".format(fingerprint)
+    if revoked is not None:
+        return "key {} revoked at {}".format(fingerprint, revoked)
+    if expires is not None and now >= expires:
+        return "key {} expired at {}".format(fingerprint, expires)
+    if primary != fingerprint:
+        return check_key(index, primary, now)
+    return None
+
+
+def check_verified(index, verified, now=None):
+    """Run ``check_key`` against a python-gnupg ``Verify`` result: both the
+    primary key and, if a subkey made the signature, the signing subkey.
+    """
+    if not verified.pubkey_fingerprint:
+        return "no signature to check"
+    signing_fingerprint = verified.fingerprint or verified.pubkey_fingerprint
+    info = index.get(signing_fingerprint)
+    if info is not None and info[0] != verified.pubkey_fingerprint:
+        return "key {} is not a subkey of {}".format(
+            signing_fingerprint, verified.pubkey_fingerprint
+        )
+    for fingerprint in (verified.pubkey_fingerprint, signing_fingerprint):
+        reason = check_key(index, fingerprint, now)
+        if reason is not None:
+            return reason
+    return None
+
+
+# load / save {{{1
+def load_index(path=INDEX_PATH):
+    with open(path, "r") as fh:
+        return {
+            fingerprint: tuple(info)
+            for fingerprint, info in json.load(fh).items()
+        }
+
+
+def save_index(index, path=INDEX_PATH):
+    with open(path, "w") as fh:
+        print(dump_json(index), file=fh, end='')
+
+
+# main {{{1
+def main(name=None):
+    """Usage: revocation.py [REVOCATION_CERT ...]
+
+    Load revocations.json (rebuilding it from ./gpg if needed), import any
+    revocation certs given on the commandline, and write it back out.
+    """
+    if name not in (None, '__main__'):
+        return
+    log.setLevel(logging.DEBUG)
+    formatter = logging.Formatter(
+        fmt="%(asctime)s %(levelname)8s - %(message)s", datefmt="%Y-%m-%dT%H:%M:%S"
+    )
+    handler = logging.StreamHandler()
+    handler.setFormatter(formatter)
+    log.addHandler(handler)
+    gnupghome = os.path.join(os.getcwd(), 'gpg')
+    os.chmod(gnupghome, 0o700)
+    index = get_index(gnupghome)
+    for path in sys.argv[1:]:
+        with open(path, "r") as fh:
+            import_revocation(gnupghome, index, fh.read())
+    save_index(index)
+
+
+main(name=__name__)
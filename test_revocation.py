@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+"""Tests for revocation.py.  Run with ``python -m pytest test_revocation.py``.
+"""
+from optparse import Values
+import os
+import pytest
+import shutil
+import subprocess
+
+import revocation
+
+PRIMARY = "BD4B1D11F3A1F7A25121B5E0AC9B0077EEBE4303"
+SUBKEY = "69718D6840DFDB3FD823C3E6E427660AEF761614"
+OTHER = "53E40D9A5C3B6F3E1C2D4B5A6978E0F1A2B3C4D5"
+CREATED = 1792422130
+EXPIRES = 1792508530
+SUB_EXPIRES = 1792594930
+
+# A primary key with an expiry, and a signing subkey with its own expiry.
+SUBKEY_LISTING = """tru::1:1792422130:1792508530:3:1:5
+pub:u:2048:1:AC9B0077EEBE4303:1792422130:1792508530::u:::cSC::::::23::0:
+fpr:::::::::BD4B1D11F3A1F7A25121B5E0AC9B0077EEBE4303:
+uid:u::::1792422130::83492BC24327BB922F60542D1DDCD6EE64D97546::T <t@example.com>::::::::::0:
+sig:!::1:AC9B0077EEBE4303:1792422130::::T <t@example.com>:13x::BD4B1D11F3A1F7A25121B5E0AC9B0077EEBE4303:::10:
+sub:u:2048:1:E427660AEF761614:1792422130:1792594930:::::s::::::23:
+fpr:::::::::69718D6840DFDB3FD823C3E6E427660AEF761614:
+sig:!::1:AC9B0077EEBE4303:1792422130::::T <t@example.com>:18x::BD4B1D11F3A1F7A25121B5E0AC9B0077EEBE4303:::10:
+"""
+
+# The same key after importing its revocation cert.
+REVOKED_LISTING = """pub:r:2048:1:AC9B0077EEBE4303:1792422130:1792508530::-:::c::::::23::0:
+fpr:::::::::BD4B1D11F3A1F7A25121B5E0AC9B0077EEBE4303:
+rev:!::1:AC9B0077EEBE4303:1792422500::::T <t@example.com>:20x,00::BD4B1D11F3A1F7A25121B5E0AC9B0077EEBE4303:::10:
+uid:r::::1792422130::83492BC24327BB922F60542D1DDCD6EE64D97546::T <t@example.com>::::::::::0:
+sub:r:2048:1:E427660AEF761614:1792422130:1792594930:::::s::::::23:
+fpr:::::::::69718D6840DFDB3FD823C3E6E427660AEF761614:
+"""
+
+# A non-expiring key whose signing subkey alone is revoked.
+SUBKEY_REVOKED_LISTING = """pub:u:2048:1:1C2D4B5A6978E0F1:1792422130:::u:::cSC::::::23::0:
+fpr:::::::::53E40D9A5C3B6F3E1C2D4B5A6978E0F1A2B3C4D5:
+uid:u::::1792422130::83492BC24327BB922F60542D1DDCD6EE64D97546::O <o@example.com>::::::::::0:
+sub:r:2048:1:E427660AEF761614:1792422130::::::s::::::23:
+fpr:::::::::69718D6840DFDB3FD823C3E6E427660AEF761614:
+rev:!::1:1C2D4B5A6978E0F1:1792422600::::O <o@example.com>:28x,00::53E40D9A5C3B6F3E1C2D4B5A6978E0F1A2B3C4D5:::10:
+"""
+
+# A revocation sig gpg couldn't verify ("-"), on a key gpg says is fine.
+BOGUS_REVOCATION_LISTING = """pub:u:2048:1:1C2D4B5A6978E0F1:1792422130:::u:::cSC::::::23::0:
+fpr:::::::::53E40D9A5C3B6F3E1C2D4B5A6978E0F1A2B3C4D5:
+rev:-::1:1C2D4B5A6978E0F1:1792422600::::O <o@example.com>:20x,00::53E40D9A5C3B6F3E1C2D4B5A6978E0F1A2B3C4D5:::10:
+uid:u::::1792422130::83492BC24327BB922F60542D1DDCD6EE64D97546::O <o@example.com>::::::::::0:
+"""
+
+
+def _verified(pubkey_fingerprint, fingerprint):
+    return Values({
+        "pubkey_fingerprint": pubkey_fingerprint,
+        "fingerprint": fingerprint,
+    })
+
+
+# parse_colons {{{1
+def test_parse_subkey():
+    index = revocation.parse_colons(SUBKEY_LISTING)
+    assert index == {
+        PRIMARY: (PRIMARY, CREATED, EXPIRES, None),
+        SUBKEY: (PRIMARY, CREATED, SUB_EXPIRES, None),
+    }
+
+
+def test_parse_revoked():
+    index = revocation.parse_colons(REVOKED_LISTING)
+    assert index[PRIMARY] == (PRIMARY, CREATED, EXPIRES, 1792422500)
+    # no rev record for the subkey, but gpg marks it revoked
+    assert index[SUBKEY][3] == revocation.REVOKED_UNKNOWN_TIME
+
+
+def test_parse_subkey_revoked():
+    index = revocation.parse_colons(SUBKEY_REVOKED_LISTING)
+    assert index[OTHER] == (OTHER, CREATED, None, None)
+    assert index[SUBKEY] == (OTHER, CREATED, None, 1792422600)
+
+
+def test_parse_bogus_revocation():
+    index = revocation.parse_colons(BOGUS_REVOCATION_LISTING)
+    assert index[OTHER][3] is None
+
+
+def test_parse_foreign_revocation():
+    """A good class 0x20 sig from some other key doesn't revoke anything."""
+    listing = BOGUS_REVOCATION_LISTING.replace(
+        "rev:-::1:1C2D4B5A6978E0F1:", "rev:!::1:AC9B0077EEBE4303:"
+    )
+    index = revocation.parse_colons(listing)
+    assert index[OTHER][3] is None
+
+
+# check_key {{{1
+def test_check_key_good():
+    index = revocation.parse_colons(SUBKEY_LISTING)
+    assert revocation.check_key(index, PRIMARY, CREATED + 1) is None
+    assert revocation.check_key(index, SUBKEY, CREATED + 1) is None
+
+
+def test_check_key_expired():
+    index = revocation.parse_colons(SUBKEY_LISTING)
+    assert "expired" in revocation.check_key(index, PRIMARY, EXPIRES)
+    # the subkey outlives its primary key, but the primary's expiry wins
+    assert "expired" in revocation.check_key(index, SUBKEY, EXPIRES)
+    assert "expired" in revocation.check_key(index, SUBKEY, SUB_EXPIRES)
+
+
+def test_check_key_revoked():
+    index = revocation.parse_colons(REVOKED_LISTING)
+    # revoked keys are bad even before the revocation time
+    assert "revoked at 1792422500" in revocation.check_key(index, PRIMARY, CREATED)
+    assert "revoked (per gpg)" in revocation.check_key(index, SUBKEY, CREATED)
+
+
+def test_check_key_unknown():
+    index = revocation.parse_colons(SUBKEY_LISTING)
+    assert "unknown" in revocation.check_key(index, OTHER, CREATED + 1)
+
+
+# check_verified {{{1
+def test_check_verified_subkey():
+    index = revocation.parse_colons(SUBKEY_LISTING)
+    verified = _verified(PRIMARY, SUBKEY)
+    assert revocation.check_verified(index, verified, CREATED + 1) is None
+    assert "expired" in revocation.check_verified(index, verified, SUB_EXPIRES)
+
+
+def test_check_verified_revoked_subkey():
+    index = revocation.parse_colons(SUBKEY_REVOKED_LISTING)
+    verified = _verified(OTHER, SUBKEY)
+    assert "revoked" in revocation.check_verified(index, verified, CREATED + 1)
+    assert revocation.check_verified(index, _verified(OTHER, OTHER), CREATED + 1) is None
+
+
+def test_check_verified_wrong_primary():
+    index = revocation.parse_colons(SUBKEY_LISTING)
+    index.update(revocation.parse_colons(BOGUS_REVOCATION_LISTING))
+    verified = _verified(OTHER, SUBKEY)
+    assert "not a subkey" in revocation.check_verified(index, verified, CREATED + 1)
+
+
+def test_check_verified_no_signature():
+    verified = _verified(None, None)
+    assert revocation.check_verified({}, verified) is not None
+
+
+# load / save {{{1
+def test_load_save(tmp_path):
+    index = revocation.parse_colons(SUBKEY_LISTING)
+    index.update(revocation.parse_colons(SUBKEY_REVOKED_LISTING))
+    path = str(tmp_path / "revocations.json")
+    revocation.save_index(index, path)
+    assert revocation.load_index(path) == index
+
+
+# get_index {{{1
+@pytest.fixture
+def gpg_home(tmp_path, monkeypatch):
+    gpg = shutil.which("gpg2") or shutil.which("gpg")
+    if gpg is None:
+        pytest.skip("no gpg")
+    monkeypatch.setattr(revocation, "GPG", gpg)
+    home = str(tmp_path / "gpg")
+    os.mkdir(home, 0o700)
+    yield home
+    subprocess.call(["gpgconf", "--homedir", home, "--kill", "gpg-agent"])
+
+
+def test_get_index(gpg_home, tmp_path):
+    path = str(tmp_path / "revocations.json")
+    index = revocation.get_index(gpg_home, path)
+    assert index == {}
+    # fresh: loaded, not rebuilt
+    revocation.save_index({PRIMARY: (PRIMARY, CREATED, None, None)}, path)
+    assert PRIMARY in revocation.get_index(gpg_home, path)
+    # older than the keyring: rebuilt
+    pubring = os.path.join(gpg_home, "pubring.gpg")
+    os.utime(path, (0, 0))
+    assert revocation.get_index(gpg_home, path) == {}
+    # unreadable: rebuilt
+    with open(path, "w") as fh:
+        fh.write("not json")
+    assert revocation.get_index(gpg_home, path) == {}
+    assert os.path.getmtime(path) >= os.path.getmtime(pubring)
+
+
+# import_revocation {{{1
+def _gen_key(gpg_home):
+    """Generate a key in ``gpg_home``; return its fingerprint and revocation
+    cert.
+    """
+    args = [revocation.GPG] + revocation.gpg_args(gpg_home) + [
+        "--batch", "--passphrase", "", "--pinentry-mode", "loopback"
+    ]
+    subprocess.check_call(args + [
+        "--quick-gen-key", "Test <test@example.com>", "rsa2048", "cert", "1d"
+    ])
+    revocs_dir = os.path.join(gpg_home, "openpgp-revocs.d")
+    path = sorted(os.listdir(revocs_dir), key=lambda p: os.path.getmtime(os.path.join(revocs_dir, p)))[-1]
+    with open(os.path.join(revocs_dir, path), "r") as fh:
+        return path[:-len(".rev")], fh.read()
+
+
+def test_import_revocation(gpg_home):
+    args = [revocation.GPG] + revocation.gpg_args(gpg_home) + [
+        "--batch", "--passphrase", "", "--pinentry-mode", "loopback"
+    ]
+    fingerprint, cert = _gen_key(gpg_home)
+    index = revocation.build_index(gpg_home)
+    assert list(index) == [fingerprint]
+    subprocess.check_call(args + [
+        "--quick-add-key", fingerprint, "rsa2048", "sign", "1d"
+    ])
+    index = revocation.build_index(gpg_home)
+    assert len(index) == 2
+    assert revocation.check_key(index, fingerprint) is None
+    assert revocation.import_revocation(gpg_home, index, cert) == [fingerprint]
+    assert len(index) == 2
+    for key in index:
+        assert "revoked" in revocation.check_key(index, key)
+    # re-importing is fine
+    revocation.import_revocation(gpg_home, index, cert)
+
+
+def test_import_revocation_stale_index(gpg_home):
+    """The index was loaded from disk, and thinks the issuer belongs to a
+    primary key that's since been removed from the keyring.
+    """
+    fingerprint, cert = _gen_key(gpg_home)
+    index = revocation.build_index(gpg_home)
+    gone = "0" * 40
+    index[fingerprint] = (gone, CREATED, None, None)
+    index[gone] = (gone, CREATED, None, None)
+    revocation.import_revocation(gpg_home, index, cert)
+    assert list(index) == [fingerprint]
+    assert "revoked" in revocation.check_key(index, fingerprint)
+
+
+def test_import_revocation_partly_stale_index(gpg_home):
+    """gpg skips missing keys without failing if some of them exist."""
+    fingerprint, cert = _gen_key(gpg_home)
+    index = revocation.build_index(gpg_home)
+    # a removed key that happens to share the issuer's keyid
+    gone = "0" * 24 + fingerprint[-16:]
+    index[gone] = (gone, CREATED, None, None)
+    revocation.import_revocation(gpg_home, index, cert)
+    assert list(index) == [fingerprint]
+    assert "revoked" in revocation.check_key(index, fingerprint)
+
+
+def test_import_revocation_unknown_key(gpg_home, tmp_path):
+    other_home = str(tmp_path / "other")
+    os.mkdir(other_home, 0o700)
+    try:
+        _, cert = _gen_key(other_home)
+    finally:
+        subprocess.call(["gpgconf", "--homedir", other_home, "--kill", "gpg-agent"])
+    with pytest.raises(Exception):
+        revocation.import_revocation(gpg_home, {}, cert)